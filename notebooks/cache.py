@@ -0,0 +1,119 @@
+import collections
+import hashlib
+import os
+
+import numpy
+
+
+class EvaluationCache(object):
+    """
+    A least-recently-used cache of simulated traces, keyed by model, protocol,
+    tolerance and a quantised parameter vector.
+
+    Traces are kept in memory up to ``max_size`` entries. If a ``directory``
+    is given, traces stored with ``persist=True`` (e.g. best fits) are also
+    written to disk and are found again by later runs. Model and protocol
+    files are identified by their contents, so editing or regenerating them
+    invalidates old entries.
+
+    The cache is only used by the process that created it: worker processes
+    started by ``pints`` (``set_parallel(True)``) bypass it, as anything they
+    stored would never reach the parent process.
+    """
+
+    def __init__(self, max_size=16, directory=None, digits=12):
+        self.max_size = int(max_size)
+        self.directory = directory
+        self.digits = int(digits)
+        self._entries = collections.OrderedDict()
+        self._digests = {}
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, model, protocol, tolerance, parameters, times):
+        """Returns a hashable key for a single simulation"""
+        # Round parameters to a fixed number of significant digits, so that
+        # vectors differing only by floating point noise share an entry
+        quantised = tuple(
+            float('{:.{}g}'.format(p, self.digits)) for p in parameters)
+        times = numpy.ascontiguousarray(times, dtype=float)
+        return (
+            self._digest(model),
+            self._digest(protocol),
+            tolerance,
+            quantised,
+            hashlib.sha1(times.tobytes()).hexdigest(),
+        )
+
+    def _digest(self, path):
+        """Returns a hash of a file's contents, re-read when it changes"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        name = (path, stat.st_mtime_ns, stat.st_size)
+        try:
+            return self._digests[name]
+        except KeyError:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            self._digests[name] = digest
+            return digest
+
+    def active(self):
+        """Checks if this cache is used by the current process"""
+        return os.getpid() == self._pid
+
+    def _filename(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.npy')
+
+    def get(self, key):
+        """Returns a copy of the cached trace for ``key``, or ``None``"""
+        if not self.active():
+            return None
+        try:
+            values = self._entries[key]
+            self._entries.move_to_end(key)
+        except KeyError:
+            values = None
+            if self.directory is not None:
+                filename = self._filename(key)
+                if os.path.isfile(filename):
+                    values = numpy.load(filename)
+                    self._store(key, values)
+
+        if values is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return numpy.array(values, copy=True)
+
+    def put(self, key, values, persist=False):
+        """
+        Stores ``values`` for ``key``, writing to disk if ``persist``. Traces
+        from failed simulations (containing NaN) are only kept in memory.
+        """
+        if not self.active():
+            return
+        values = numpy.array(values, dtype=float, copy=True)
+        self._store(key, values)
+        if (persist and self.directory is not None
+                and numpy.all(numpy.isfinite(values))):
+            numpy.save(self._filename(key), values)
+
+    def _store(self, key, values):
+        self._entries[key] = values
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the in-memory tier (persisted traces are kept)"""
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,167 @@
+import pints
+import numpy
+
+
+# Number of samples scored at a time
+chunk_size = 8192
+
+
+def _stack(simulated):
+    """Returns simulated traces as a 2d array (one trace per row)"""
+    simulated = numpy.asarray(simulated, dtype=float)
+    return simulated.reshape((1, -1)) if simulated.ndim == 1 else simulated
+
+
+def _reduce(values, simulated):
+    """Returns a scalar for a single trace, or an array for a stack"""
+    return values[0] if numpy.ndim(simulated) == 1 else values
+
+
+def sum_of_squares(simulated, reference, weights=None, window=None):
+    """
+    Returns the (weighted) sum of squared residuals of each simulated trace
+    against ``reference``, and the total weight (the number of samples if no
+    weights are given).
+
+    Traces are scored ``chunk_size`` samples at a time, so that only a chunk
+    of residuals is held in memory. If a ``window`` ``(start, stop)`` of
+    sample indices is given, only that part of the traces is scored.
+    """
+    simulated = _stack(simulated)
+    reference = numpy.asarray(reference, dtype=float)
+    if simulated.shape[1] != len(reference):
+        raise ValueError('Simulated traces and reference differ in length.')
+    if weights is not None:
+        weights = numpy.asarray(weights, dtype=float)
+        if len(weights) != len(reference):
+            raise ValueError('Weights and reference differ in length.')
+
+    start, stop = (0, len(reference)) if window is None else window
+    if not 0 <= start < stop <= len(reference):
+        raise ValueError(
+            'Window must satisfy 0 <= start < stop <= len(reference).')
+    if weights is not None and numpy.sum(weights[start:stop]) <= 0:
+        raise ValueError('Weights must have a positive sum in the window.')
+
+    total = numpy.zeros(len(simulated))
+    for a in range(start, stop, chunk_size):
+        b = min(a + chunk_size, stop)
+        r = simulated[:, a:b] - reference[a:b]
+        if weights is None:
+            total += numpy.einsum('ij,ij->i', r, r)
+        else:
+            total += numpy.einsum('ij,ij,j->i', r, r, weights[a:b])
+
+    n = stop - start if weights is None else numpy.sum(weights[start:stop])
+    return total, n
+
+
+def mean_squared_error(simulated, reference, weights=None, window=None):
+    """Returns the (weighted) mean squared error of each simulated trace"""
+    total, n = sum_of_squares(simulated, reference, weights, window)
+    return _reduce(total / n, simulated)
+
+
+def root_mean_squared_error(simulated, reference, weights=None, window=None):
+    """Returns the (weighted) root mean squared error of each trace"""
+    total, n = sum_of_squares(simulated, reference, weights, window)
+    return _reduce(numpy.sqrt(total / n), simulated)
+
+
+def gaussian_log_likelihood(simulated, reference, sigma, window=None):
+    """
+    Returns the log-likelihood of ``reference`` given each simulated trace,
+    assuming independent Gaussian noise with standard deviation ``sigma``.
+    """
+    total, n = sum_of_squares(simulated, reference, window=window)
+    values = (-0.5 * n * numpy.log(2 * numpy.pi) - n * numpy.log(sigma)
+              - total / (2 * sigma**2))
+    return _reduce(values, simulated)
+
+
+def protocol_segments(voltage, threshold=1, min_length=100):
+    """
+    Splits a protocol into ``(start, stop)`` sample index windows at voltage
+    steps, i.e. where the voltage changes by more than ``threshold`` between
+    two samples. Steps closer than ``min_length`` samples to the previous
+    edge (e.g. the rest of an action potential upstroke) are ignored.
+    """
+    voltage = numpy.asarray(voltage, dtype=float)
+    steps = numpy.flatnonzero(numpy.abs(numpy.diff(voltage)) > threshold) + 1
+
+    edges = [0]
+    for i in steps:
+        if i - edges[-1] >= min_length and len(voltage) - i >= min_length:
+            edges.append(int(i))
+    edges.append(len(voltage))
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def segment_breakdown(simulated, reference, windows,
+                      kernel=root_mean_squared_error, **kwargs):
+    """
+    Scores each simulated trace on every window in ``windows``, and returns
+    an array with one row per trace and one column per window.
+    """
+    return numpy.stack([
+        numpy.atleast_1d(kernel(simulated, reference, window=w, **kwargs))
+        for w in windows], axis=1)
+
+
+def rmse_table(model, parameter_sets, times, reference, windows=()):
+    """
+    Simulates ``model`` with every parameter set and returns an array with
+    one row per set, holding the RMSE against ``reference`` followed by the
+    RMSE on each window in ``windows``.
+
+    Each trace is scored as soon as it is simulated, so only one trace is
+    held in memory at a time.
+    """
+    windows = [(0, len(reference))] + list(windows)
+    table = numpy.zeros((len(parameter_sets), len(windows)))
+    for i, p in enumerate(parameter_sets):
+        simulated = model.simulate(p, times)
+        for j, w in enumerate(windows):
+            total, n = sum_of_squares(simulated, reference, window=w)
+            table[i, j] = numpy.sqrt(total[0] / n)
+    return table
+
+
+class MeanSquaredError(pints.ProblemErrorMeasure):
+    """
+    A :class:`pints.ProblemErrorMeasure` for single output problems, that
+    calculates an optionally weighted and windowed mean squared error.
+    """
+
+    def __init__(self, problem, weights=None, window=None):
+        super().__init__(problem)
+        if self._n_outputs != 1:
+            raise ValueError('Only single output problems are supported.')
+        self._weights = weights
+        self._window = window
+
+    def __call__(self, x):
+        return mean_squared_error(self._problem.evaluate(x), self._values,
+                                  self._weights, self._window)
+
+
+class GaussianKnownSigmaLogLikelihood(pints.ProblemLogLikelihood):
+    """
+    A :class:`pints.ProblemLogLikelihood` for single output problems, that
+    assumes independent Gaussian noise with a known standard deviation (as
+    :class:`pints.GaussianKnownSigmaLogLikelihood`).
+    """
+
+    def __init__(self, problem, sigma, window=None):
+        super().__init__(problem)
+        if problem.n_outputs() != 1:
+            raise ValueError('Only single output problems are supported.')
+        self._sigma = float(sigma)
+        if self._sigma <= 0:
+            raise ValueError('Standard deviation must be positive.')
+        self._window = window
+
+    def __call__(self, x):
+        return gaussian_log_likelihood(self._problem.evaluate(x),
+                                       self._values, self._sigma,
+                                       self._window)
@@ -4,9 +4,18 @@ import numpy
 
 
 class Model(pints.ForwardModel):
-    def __init__(self, model, protocol):
+    def __init__(self, model, protocol, cache=None, reduced=None):
         super().__init__()
 
+        # Store file paths, used to identify cached simulations
+        self.model_path = model
+        self.protocol_path = protocol
+        self.reduced_path = reduced
+
+        # Optional EvaluationCache shared between models
+        self.cache = cache
+        self.tolerance = None
+
         # Load model
         self.model = myokit.load_model(model)
 
@@ -28,13 +37,55 @@ class Model(pints.ForwardModel):
         # Set max step size
         self.sim.set_max_step_size(0.1)
 
+        # Optional reduced model (see reduction.py), used during exploration
+        self.full_sim = self.sim
+        self.reduced_sim = None
+        if reduced is not None:
+            self.reduced_sim = myokit.Simulation(myokit.load_model(reduced))
+            self.reduced_sim.set_fixed_form_protocol(self.time, self.voltage)
+            self.reduced_sim.set_max_step_size(0.1)
+
     def n_parameters(self):
         return int(self.model.value('ikr.n_params'))
 
     def set_tolerance(self, tol):
-        self.sim.set_tolerance(tol, tol)
+        self.full_sim.set_tolerance(tol, tol)
+        if self.reduced_sim is not None:
+            self.reduced_sim.set_tolerance(tol, tol)
+        self.tolerance = tol
+
+    def use_reduced(self, enabled=True):
+        """
+        Switches between the reduced model (for exploration) and the full
+        model (for final evaluation).
+        """
+        if enabled and self.reduced_sim is None:
+            raise ValueError('No reduced model was given.')
+        self.sim = self.reduced_sim if enabled else self.full_sim
+
+    def using_reduced(self):
+        return self.sim is not self.full_sim
+
+    def simulate(self, parameters, times, persist=False):
+        # Return a previous result for the same parameters, if available
+        key = None
+        if self.cache is not None and self.cache.active():
+            path = self.reduced_path if self.using_reduced() \
+                else self.model_path
+            key = self.cache.key(path, self.protocol_path,
+                                 self.tolerance, parameters, times)
+            values = self.cache.get(key)
+            if values is not None:
+                if persist:
+                    self.cache.put(key, values, persist=True)
+                return values
+
+        values = self._simulate(parameters, times)
+        if key is not None:
+            self.cache.put(key, values, persist=persist)
+        return values
 
-    def simulate(self, parameters, times):
+    def _simulate(self, parameters, times):
         # Reset to default time and state
         self.sim.reset()
 
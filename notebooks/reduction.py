@@ -0,0 +1,287 @@
+import myokit
+import numpy
+
+
+class TimescaleAnalysis(object):
+    """
+    Inspects the transition rates of a Markov model over the voltage range
+    used by a protocol, and creates a reduced model in which fast states are
+    replaced by their quasi-steady-state values.
+
+    For every voltage in the range the state derivatives are linear in the
+    states, so the matrix ``A`` in ``dx/dt = A x + b`` is found exactly by
+    evaluating the derivatives at unit state vectors. Because one state is
+    usually eliminated through conservation (e.g. ``I = 1 - (O + C1 + ...)``),
+    the diagonal of ``A`` is not a set of exit rates. Instead, timescales are
+    taken from the eigenvalues of ``A``: the ``m`` fastest modes are split off
+    if they decay at least ``separation`` times faster than every remaining
+    mode, and the ``m`` states that participate most in those modes are
+    marked fast. Setting ``dx/dt = 0`` is only accurate if the fast modes are
+    confined to those states, so a split is rejected if any remaining state
+    has a participation above ``1 / separation`` in the fast modes (as happens
+    for a pair of states exchanging rapidly with each other, which would need
+    lumping rather than elimination).
+
+    Timescales depend on the parameters, so the analysis is run for every
+    parameter set in ``parameters`` (a single vector or a list of vectors)
+    and, if ``boundaries`` are given, for ``n_samples`` sets drawn from them.
+    If neither is given the values in the model file are used. The reported
+    separation and error bound only hold for the analysed parameter sets; use
+    :meth:`epsilon` to check other points, e.g. a best fit.
+    """
+
+    def __init__(self, model, protocol, parameters=None, boundaries=None,
+                 n_samples=20, separation=10, n_voltages=50):
+        self.model_path = model
+        self.protocol_path = protocol
+        self.separation = float(separation)
+
+        # Load model
+        self.model = myokit.load_model(model)
+        self.states = [x.qname() for x in self.model.states()]
+        self.n_parameters = int(self.model.value('ikr.n_params'))
+
+        # Parameter sets to analyse
+        sets = []
+        if parameters is not None:
+            sets.extend(numpy.atleast_2d(parameters))
+        if boundaries is not None:
+            sets.extend(boundaries.sample(n_samples))
+        if not sets:
+            sets.append([self.model.get('ikr.p' + str(1 + i)).eval()
+                         for i in range(self.n_parameters)])
+        self.parameter_sets = numpy.array(sets, dtype=float)
+
+        # Voltage range used by the protocol
+        log = myokit.DataLog.load_csv(protocol).npview()
+        self.voltages = numpy.linspace(
+            numpy.min(log['voltage']), numpy.max(log['voltage']), n_voltages)
+
+        # Rate matrices, and decay rates and participations of their modes
+        self.matrices = numpy.array(
+            [self._rate_matrices(p) for p in self.parameter_sets])
+        self.rates, self.participation = self._modes(self.matrices)
+
+        self._fast, self.ratio = self._split()
+
+    def _rate_matrices(self, parameters):
+        """Returns an array of rate matrices, one per voltage"""
+        model = self.model.clone()
+        for i, p in enumerate(parameters):
+            model.get('ikr.p' + str(1 + i)).set_rhs(p)
+
+        n = len(self.states)
+        matrices = numpy.zeros((len(self.voltages), n, n))
+        for k, v in enumerate(self.voltages):
+            inputs = {'pace': v}
+            f0 = numpy.array(model.evaluate_derivatives(numpy.zeros(n), inputs))
+            for j in range(n):
+                x = numpy.zeros(n)
+                x[j] = 1
+                f1 = numpy.array(model.evaluate_derivatives(x, inputs))
+                x[j] = 2
+                f2 = numpy.array(model.evaluate_derivatives(x, inputs))
+                if not numpy.allclose(f2 - f0, 2 * (f1 - f0)):
+                    raise ValueError(
+                        'Derivatives are not linear in ' + self.states[j])
+                matrices[k, :, j] = f1 - f0
+        return matrices
+
+    def _modes(self, matrices):
+        """
+        Returns the decay rates of the modes of each matrix (fastest first),
+        and the participation of each state in each mode.
+        """
+        eigenvalues, right = numpy.linalg.eig(matrices)
+        left = numpy.linalg.inv(right)
+
+        # Participation factors |r_ij * l_ji|, normalised per state
+        participation = numpy.abs(right * numpy.swapaxes(left, -1, -2))
+        participation /= numpy.sum(participation, axis=-1, keepdims=True)
+
+        rates = -eigenvalues.real
+        order = numpy.argsort(-rates, axis=-1)
+        rates = numpy.take_along_axis(rates, order, axis=-1)
+        participation = numpy.take_along_axis(
+            participation, order[..., None, :], axis=-1)
+        return rates, participation
+
+    def _ratios(self, rates):
+        """Returns the smallest gap between the m-th and m+1-th mode"""
+        rates = rates.reshape((-1, rates.shape[-1]))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            gaps = rates[:, :-1] / rates[:, 1:]
+        gaps[~(rates[:, 1:] > 0)] = numpy.inf
+        return numpy.min(gaps, axis=0)
+
+    def _split(self):
+        """Returns the largest set of fast states and its separation ratio"""
+        n = len(self.states)
+        ratios = self._ratios(self.rates)
+        participation = self.participation.reshape((-1, n, n))
+
+        # Try the largest number of fast modes first (keeping a slow one)
+        for m in range(n - 1, 0, -1):
+            if ratios[m - 1] < self.separation:
+                continue
+
+            # Pick the states with the highest participation in the fast
+            # modes, taking the lowest value over all voltages and parameters
+            share = numpy.sum(participation[:, :, :m], axis=-1)
+            order = numpy.argsort(-numpy.min(share, axis=0))
+
+            # Check that the fast modes are confined to those states
+            if numpy.max(share[:, order[m:]]) <= 1 / self.separation:
+                return sorted(order[:m].tolist()), ratios[m - 1]
+        return [], 1.0
+
+    def fast_states(self):
+        """Returns the names of the states marked as fast"""
+        return [self.states[i] for i in self._fast]
+
+    def groups(self):
+        """
+        Returns the fast states as groups that take part in the same fast
+        mode (with a participation above ``1 / separation``) at some voltage
+        and parameter set.
+        """
+        n, m = len(self.states), len(self._fast)
+        participation = self.participation.reshape((-1, n, n))
+        shared = participation[:, self._fast, :m] > 1 / self.separation
+
+        # Two fast states are coupled if they share any fast mode
+        shared = shared.transpose((0, 2, 1)).reshape((-1, m))
+        coupled = numpy.any(
+            shared[:, :, None] & shared[:, None, :], axis=0)
+
+        groups, remaining = [], list(range(m))
+        while remaining:
+            group, todo = [], [remaining.pop(0)]
+            while todo:
+                i = todo.pop()
+                group.append(self._fast[i])
+                for j in list(remaining):
+                    if coupled[i, j]:
+                        remaining.remove(j)
+                        todo.append(j)
+            groups.append([self.states[i] for i in sorted(group)])
+        return groups
+
+    def epsilon(self, parameters=None):
+        """
+        Returns the ratio of slow to fast timescales, which sets the order of
+        the quasi-steady-state error (zero if no states are fast).
+
+        By default the worst case over the analysed parameter sets is
+        returned. If ``parameters`` are given, the ratio is evaluated for that
+        vector instead; a value above ``1 / separation`` means the reduced
+        model should not be trusted there.
+        """
+        if not self._fast:
+            return 0
+        if parameters is None:
+            return 1 / self.ratio
+        rates, _ = self._modes(self._rate_matrices(parameters))
+        return 1 / self._ratios(rates)[len(self._fast) - 1]
+
+    def reduce(self):
+        """
+        Returns a clone of the model in which every fast state is replaced by
+        the solution of ``dx/dt = 0``.
+        """
+        model = self.model.clone()
+        fast = [model.get(name) for name in self.fast_states()]
+        if not fast:
+            return model
+
+        # Variables that can be kept by name: anything not affected by states
+        depends = {}
+        retain = [v for v in model.variables(deep=True)
+                  if not v.is_state() and not _depends_on_state(v, depends)]
+
+        # Write each fast derivative in terms of states and retained variables
+        rhs = [x.rhs().clone(expand=True, retain=retain) for x in fast]
+
+        # Solve the linear equations one at a time, substituting each solution
+        # into the remaining equations so that no cyclic references arise
+        solutions = []
+        for i, x in enumerate(fast):
+            name = myokit.Name(x)
+            f0 = rhs[i].clone(subst={name: myokit.Number(0)})
+            f1 = rhs[i].clone(subst={name: myokit.Number(1)})
+            solution = myokit.Divide(
+                myokit.PrefixMinus(f0), myokit.Minus(f1, f0))
+            for j in range(i + 1, len(fast)):
+                rhs[j] = rhs[j].clone(subst={name: solution})
+            solutions.append(solution)
+
+        for x, solution in zip(fast, solutions):
+            x.demote()
+            x.set_rhs(solution)
+            x.meta['desc'] = 'Quasi-steady-state approximation'
+
+        model.meta['desc'] = (
+            'Reduced version of ' + self.model.name() + ', fast states: '
+            + ', '.join(self.fast_states()))
+        model.validate()
+        return model
+
+    def save(self, path):
+        """Stores the reduced model as an ``.mmt`` file and returns it"""
+        model = self.reduce()
+        myokit.save_model(path, model)
+        return model
+
+    def error_bound(self, reduced=None, parameter_sets=None, tolerance=1e-8):
+        """
+        Simulates the full and reduced model on the protocol and returns the
+        maximum absolute difference in current, and that difference relative
+        to the peak absolute current of the full model.
+
+        The maximum is taken over ``parameter_sets`` (by default the analysed
+        sets); sets for which either simulation fails are skipped.
+        """
+        if reduced is None:
+            reduced = self.reduce()
+        if parameter_sets is None:
+            parameter_sets = self.parameter_sets
+        log = myokit.DataLog.load_csv(self.protocol_path).npview()
+        times = log['time']
+        time_max = times[-1] + (times[-1] - times[-2])
+
+        sims = []
+        for model in (self.model, reduced):
+            sim = myokit.Simulation(model)
+            sim.set_fixed_form_protocol(times, log['voltage'])
+            sim.set_max_step_size(0.1)
+            sim.set_tolerance(tolerance, tolerance)
+            sims.append(sim)
+
+        error = relative = 0
+        for parameters in parameter_sets:
+            currents = []
+            try:
+                for sim in sims:
+                    sim.reset()
+                    for i, p in enumerate(parameters):
+                        sim.set_constant('ikr.p' + str(1 + i), p)
+                    d = sim.run(time_max, log_times=times, log=['ikr.IKr'])
+                    currents.append(numpy.asarray(d['ikr.IKr']))
+            except myokit.SimulationError:
+                continue
+            e = numpy.max(numpy.abs(currents[0] - currents[1]))
+            error = max(error, e)
+            relative = max(relative, e / numpy.max(numpy.abs(currents[0])))
+        return error, relative
+
+
+def _depends_on_state(variable, known):
+    """Checks if a variable depends on any state, directly or indirectly"""
+    if variable not in known:
+        known[variable] = False
+        for ref in variable.rhs().references():
+            v = ref.var()
+            if v.is_state() or _depends_on_state(v, known):
+                known[variable] = True
+                break
+    return known[variable]